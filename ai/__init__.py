@@ -1,3 +1,4 @@
 from .client import AIClient
+from .stream import ResponseStream
 
-__all__ = ["AIClient"]
+__all__ = ["AIClient", "ResponseStream"]
@@ -1,6 +1,42 @@
+import socket
+import threading
 import litellm
-from typing import List, Dict, Any, Optional, Union, Generator
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+from typing import List, Dict, Any, Optional, Union, Generator, Callable
 from config import Config
+from .stream import ResponseStream
+
+# Providers whose streaming path accepts a caller-owned litellm HTTPHandler via `client=`
+_HTTP_HANDLER_PROVIDERS = {"gemini", "vertex_ai", "vertex_ai_beta"}
+
+
+class _StreamingHTTPHandler(HTTPHandler):
+    """
+    HTTPHandler that remembers its latest response, so a stream stalled in a blocking read
+    can be aborted from another thread (closing the httpx client alone does not wake the reader).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.response = None
+        hooks = dict(self.client.event_hooks)
+        hooks["response"] = [*hooks.get("response", []), self._capture]
+        self.client.event_hooks = hooks
+
+    def _capture(self, response):
+        self.response = response
+
+    def abort(self):
+        response, self.response = self.response, None
+        if response is None:
+            return
+        network_stream = response.extensions.get("network_stream")
+        sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 class AIClient:
     def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None, system_instruction: Optional[str] = None, **kwargs):
@@ -20,6 +56,12 @@ class AIClient:
         self.api_key = api_key or ai_config.get("api_key")
         self.system_instruction = system_instruction
         self.default_params = kwargs
+        # Per-read timeout for streaming calls: bounds how long a stalled stream can hold its connection
+        self.stream_timeout = ai_config.get("stream_timeout", 30.0)
+        # Idle HTTP clients kept for reuse by stream_response(); a cancelled stream's client is closed instead
+        self.max_idle_http_clients = ai_config.get("max_idle_http_clients", 4)
+        self._idle_http_clients: List[_StreamingHTTPHandler] = []
+        self._http_lock = threading.Lock()
 
     def generate_response(self, messages: List[Dict[str, Any]], model: Optional[str] = None, system_instruction: Optional[str] = None, tools: Optional[List[Dict[str, Any]]] = None, stream: bool = False, **kwargs) -> Union[Any, Generator]:
         """
@@ -76,6 +118,70 @@ class AIClient:
             # Propagate the exception for the caller to handle
             raise e
 
+    def stream_response(self, messages: List[Dict[str, Any]], model: Optional[str] = None, system_instruction: Optional[str] = None, max_latency: Optional[float] = None, max_tokens: Optional[int] = None, on_close: Optional[Callable[[ResponseStream], None]] = None, **kwargs) -> ResponseStream:
+        """
+        Starts a streaming generation and wraps it in a cancellable ResponseStream.
+
+        For Gemini / Vertex models the stream gets its own HTTP client. On cancel its socket is shut down and the
+        client closed, so the connection is dropped immediately; when the stream completes the client goes back
+        to an idle pool for reuse.
+        Other providers rely on the per-read `stream_timeout` to bound a stalled connection.
+
+        :param messages: Same as generate_response.
+        :param model: Optional model override.
+        :param system_instruction: Optional system instruction override.
+        :param max_latency: Optional wall-clock deadline in seconds for the whole reply.
+        :param max_tokens: Optional output token limit, enforced by the provider. It includes any <thinking> block.
+        :param on_close: Optional callback invoked with the handle once the stream ends.
+        :param kwargs: Optional overrides for generation parameters.
+        :return: A ResponseStream.
+        """
+        target_model = model or self.default_model
+        params = dict(kwargs)
+        params.setdefault('timeout', self.stream_timeout)
+        if max_tokens is not None:
+            params['max_tokens'] = max_tokens
+
+        http_client = self._checkout_http_client(target_model)
+        if http_client is not None:
+            params['client'] = http_client
+        try:
+            stream = self.generate_response(messages, model=target_model, system_instruction=system_instruction, stream=True, **params)
+        except Exception:
+            if http_client is not None:
+                self._release_http_client(http_client, reusable=False)
+            raise
+
+        on_release = None
+        if http_client is not None:
+            on_release = lambda reusable: self._release_http_client(http_client, reusable)
+        return ResponseStream(stream, max_latency=max_latency, on_close=on_close, on_release=on_release)
+
+    def _checkout_http_client(self, model: str) -> Optional[_StreamingHTTPHandler]:
+        try:
+            _, provider, _, _ = litellm.get_llm_provider(model)
+        except Exception:
+            return None
+        if provider not in _HTTP_HANDLER_PROVIDERS:
+            return None
+        with self._http_lock:
+            if self._idle_http_clients:
+                return self._idle_http_clients.pop()
+        return _StreamingHTTPHandler(timeout=self.stream_timeout)
+
+    def _release_http_client(self, client: _StreamingHTTPHandler, reusable: bool):
+        if reusable:
+            with self._http_lock:
+                if len(self._idle_http_clients) < self.max_idle_http_clients:
+                    self._idle_http_clients.append(client)
+                    return
+        try:
+            # Shut the socket down first so a reader blocked mid-stream fails immediately, then drop the pool
+            client.abort()
+            client.close()
+        except Exception:
+            pass
+
     def get_response_content(self, response: Any) -> Optional[str]:
         """
         Helper to extract the text content from the response object.
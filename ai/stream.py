@@ -0,0 +1,279 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional
+
+# Queue sentinels passed from the reader thread to the consumer
+_END = object()
+_WAKE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class ResponseStream:
+    def __init__(self, stream: Any, max_latency: Optional[float] = None, on_close: Optional[Callable[["ResponseStream"], None]] = None, on_release: Optional[Callable[[bool], None]] = None):
+        """
+        Wraps a LiteLLM streaming response so that it can be cancelled mid-reply.
+
+        Iterating over it yields the same chunks as the underlying stream, so existing
+        `for chunk in response_stream` loops keep working unchanged. The provider stream is read on a
+        background thread, so the consumer never blocks past a cancel() or the deadline, even while the
+        provider is stalled between chunks.
+
+        Done callbacks always run on the consuming thread (or on the thread that calls cancel() while
+        nobody is consuming), never on the deadline timer. A handle that is neither iterated nor cancelled
+        never runs its callbacks.
+
+        :param stream: The generator / CustomStreamWrapper returned by litellm.completion(stream=True).
+        :param max_latency: Optional wall-clock deadline in seconds, counted from construction.
+                            Iteration stops as soon as it is exceeded and the connection is released.
+        :param on_close: Optional callback invoked exactly once with this handle after the stream ends,
+                         whether it completed, was cancelled, hit a limit, or raised.
+        :param on_release: Optional callback invoked exactly once to release the HTTP connection.
+                           Receives True if the stream was fully read (connection reusable), False otherwise.
+        """
+        self._stream = stream
+        self._gen: Optional[Iterator] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._reader: Optional[threading.Thread] = None
+        self.max_latency = max_latency
+
+        self.text = ""
+        self.cancelled = False
+        self.cancel_reason: Optional[str] = None
+        self.truncated = False
+        self.error: Optional[BaseException] = None
+        self.finished = False
+
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[["ResponseStream"], None]] = [on_close] if on_close else []
+        self._finishing = False
+        self._consuming = False
+        self._on_release = on_release
+        self._released = False
+        self._pending: List[Any] = []
+        self._started_at = time.monotonic()
+        self._deadline = self._started_at + max_latency if max_latency is not None else None
+        self._timer: Optional[threading.Timer] = None
+        if max_latency is not None:
+            # Only frees the connection when nobody is consuming; the consumer enforces the deadline itself
+            self._timer = threading.Timer(max_latency, self._request_cancel, kwargs={"reason": "max_latency"})
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def interrupted(self) -> bool:
+        """True if the reply was cut short (cancel, deadline, token limit or stream error) rather than finishing normally."""
+        return self.cancelled or self.truncated or self.error is not None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started_at
+
+    def add_done_callback(self, fn: Callable[["ResponseStream"], None]):
+        """
+        Registers a callback to run when the stream ends. If it has already ended, runs it immediately.
+        Callbacks run in registration order.
+        """
+        with self._lock:
+            if not self.finished:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Stops the generation and releases the underlying connection.
+        Safe to call from any thread and safe to call twice. If another thread is currently waiting on the
+        stream, it wakes up immediately and runs the done callbacks; otherwise they run here.
+        """
+        if not self._request_cancel(reason):
+            self._finish()
+
+    def prefetch(self) -> bool:
+        """
+        Blocks until the first content chunk arrives and buffers it, so that later iteration replays it.
+        Useful to race several streams against each other on time-to-first-token.
+
+        :return: True if content was received, False if the stream ended or was cancelled first.
+        """
+        if self._pending:
+            return True
+        for chunk in self._generator():
+            self._pending.append(chunk)
+            if self._chunk_content(chunk):
+                return True
+        return False
+
+    def collect(self) -> str:
+        """Consumes the rest of the stream and returns the full (possibly partial) text."""
+        for _ in self:
+            pass
+        return self.text
+
+    def __iter__(self):
+        while self._pending:
+            yield self._pending.pop(0)
+        yield from self._generator()
+
+    def _generator(self) -> Iterator:
+        # A single generator is shared by prefetch() and __iter__ so that stopping early in prefetch()
+        # does not close it.
+        if self._gen is None:
+            self._gen = self._chunks()
+        return self._gen
+
+    def _chunks(self):
+        completed = False
+        try:
+            if self._reader is None:
+                self._reader = threading.Thread(target=self._read, name="response-stream", daemon=True)
+                self._reader.start()
+            while True:
+                item = self._next_item()
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    if self.cancelled:
+                        # Closing the connection under a blocked read typically surfaces as an exception
+                        break
+                    self.error = item.error
+                    raise item.error
+
+                content = self._chunk_content(chunk=item)
+                with self._lock:
+                    # cancel() may have fired from another thread while we were waiting
+                    if self.cancelled:
+                        break
+                    if content:
+                        self.text += content
+                    if self._finish_reason(item) == "length":
+                        self.truncated = True
+                yield item
+            completed = not self.cancelled
+        finally:
+            # Any other exit (consumer break, KeyboardInterrupt, error) must still release and finish
+            if not completed and not self.cancelled and self.error is None:
+                self._request_cancel("abandoned")
+            if self.error is not None:
+                self._release(False)
+            self._finish()
+
+    def _next_item(self) -> Any:
+        with self._lock:
+            if self.cancelled:
+                return _END
+            self._consuming = True
+        try:
+            while True:
+                timeout = None
+                if self._deadline is not None:
+                    timeout = max(0.0, self._deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                    break
+                if item is not _WAKE:
+                    break
+                if self.cancelled:
+                    item = _END
+                    break
+        finally:
+            with self._lock:
+                self._consuming = False
+        if item is None:
+            self._request_cancel("max_latency")
+            return _END
+        return item
+
+    def _read(self):
+        # Reader thread: owns iteration of the provider stream
+        reusable = False
+        try:
+            for chunk in self._stream:
+                if self.cancelled:
+                    break
+                self._queue.put(chunk)
+            else:
+                reusable = True
+            self._queue.put(_END)
+        except BaseException as e:
+            self._queue.put(_Failure(e))
+        finally:
+            self._release(reusable)
+
+    def _request_cancel(self, reason: str) -> bool:
+        """
+        Flags the stream as cancelled and frees the connection, without running callbacks.
+
+        :return: True if a consumer is currently waiting and will run the callbacks itself.
+        """
+        with self._lock:
+            if self._finishing or self.cancelled:
+                return self._consuming
+            self.cancelled = True
+            self.cancel_reason = reason
+            consuming = self._consuming
+        if self._timer is not None:
+            self._timer.cancel()
+        self._release(False)
+        self._queue.put(_WAKE)
+        return consuming
+
+    def _release(self, reusable: bool):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if self._on_release is not None:
+            try:
+                self._on_release(reusable)
+            except Exception:
+                pass
+        if not reusable:
+            # OpenAI-compatible providers expose a closable stream object; Gemini is handled by on_release
+            close = getattr(getattr(self._stream, 'completion_stream', None), 'close', None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _chunk_content(chunk: Any) -> Optional[str]:
+        if chunk and hasattr(chunk, 'choices') and len(chunk.choices) > 0:
+            delta = chunk.choices[0].delta
+            if hasattr(delta, 'content') and delta.content:
+                return delta.content
+        return None
+
+    @staticmethod
+    def _finish_reason(chunk: Any) -> Optional[str]:
+        if chunk and hasattr(chunk, 'choices') and len(chunk.choices) > 0:
+            return getattr(chunk.choices[0], 'finish_reason', None)
+        return None
+
+    def _finish(self):
+        with self._lock:
+            if self._finishing:
+                return
+            self._finishing = True
+        if self._timer is not None:
+            self._timer.cancel()
+        try:
+            while True:
+                with self._lock:
+                    callbacks, self._callbacks = self._callbacks, []
+                    if not callbacks:
+                        # `finished` only flips once every callback has run
+                        self.finished = True
+                        return
+                for fn in callbacks:
+                    fn(self)
+        finally:
+            with self._lock:
+                self.finished = True
@@ -14,6 +14,10 @@ class Config:
     def get_ai_config(self):
         return self.config.get("ai", {})
 
+    def get_session_config(self):
+        # An empty `session:` key parses as None
+        return self.config.get("session") or {}
+
 # Example usage:
 # config = Config()
 # ai_settings = config.get_ai_config()
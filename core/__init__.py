@@ -0,0 +1,3 @@
+from .session import Session, SessionStore, TurnLog
+
+__all__ = ["Session", "SessionStore", "TurnLog"]
@@ -0,0 +1,419 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai.stream import ResponseStream
+from personal.person import EmotionalState, Person
+
+# Snapshot file: header (magic, format version, crc32 of payload) + zlib-compressed JSON payload
+SNAPSHOT_MAGIC = b"AMPS"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct(">4sBI")
+
+# Turn log record: header (payload length, crc32 of payload) + UTF-8 JSON payload
+_RECORD_HEADER = struct.Struct(">II")
+
+
+def _encode(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_snapshot(path: str, state: Dict[str, Any]):
+    """
+    Atomically writes a compact binary snapshot.
+    The data goes to a temp file first and is renamed over the old snapshot, so a crash never leaves a half-written one.
+    """
+    payload = zlib.compress(_encode(state))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _SNAPSHOT_HEADER.size:
+        raise ValueError(f"Snapshot {path} is truncated")
+    magic, version, checksum = _SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a session snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version} in {path}")
+    payload = data[_SNAPSHOT_HEADER.size:]
+    if zlib.crc32(payload) != checksum:
+        raise ValueError(f"Snapshot {path} is corrupted (checksum mismatch)")
+    return json.loads(zlib.decompress(payload))
+
+
+class TurnLog:
+    def __init__(self, path: str, fsync_every: int = 8, fsync_interval: float = 1.0):
+        """
+        Append-only, length-prefixed and checksummed record log.
+
+        Writes are flushed to the OS on every append, but fsync() is batched: append() runs it once `fsync_every`
+        records are pending or `fsync_interval` seconds have passed since the last fsync, and sync()/close() always do.
+        There is no background flusher, so callers that stop appending must call sync() themselves
+        (Session does so at the end of every turn).
+
+        :param path: Log file path. Created if it does not exist.
+        :param fsync_every: Number of appended records that triggers an fsync.
+        :param fsync_interval: Seconds since the last fsync after which the next append() fsyncs.
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Drop a torn tail left by a crash, so new records are not appended after garbage
+        _, valid_size = self.scan(path)
+        self._file = open(path, "ab")
+        if self._file.tell() != valid_size:
+            self._file.truncate(valid_size)
+
+    @staticmethod
+    def scan(path: str) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Reads every intact record from a log file.
+
+        :return: (records, size in bytes of the valid prefix). Reading stops at the first truncated or corrupted record.
+        """
+        if not os.path.exists(path):
+            return [], 0
+        with open(path, "rb") as f:
+            data = f.read()
+        records = []
+        offset = 0
+        while offset + _RECORD_HEADER.size <= len(data):
+            length, checksum = _RECORD_HEADER.unpack_from(data, offset)
+            start = offset + _RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            try:
+                records.append(json.loads(payload))
+            except ValueError:
+                break
+            offset = start + length
+        return records, offset
+
+    def append(self, record: Dict[str, Any]):
+        payload = _encode(record)
+        with self._lock:
+            self._file.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def reset(self):
+        """Empties the log. Called after its contents have been folded into a snapshot."""
+        with self._lock:
+            self._file.truncate(0)
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync_locked()
+            self._file.close()
+
+    def _sync_locked(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+
+class Session:
+    def __init__(self, session_id: str, person: Person, history: List[Dict[str, Any]], log: TurnLog, seq: int = 0, max_history: int = 10):
+        """
+        A live conversation: the persona, its chat history and the turn log that makes both durable.
+        Obtain instances from SessionStore rather than constructing them directly.
+        """
+        self.session_id = session_id
+        self.person = person
+        self.history = history
+        self.log = log
+        self.seq = seq
+        self.max_history = max_history
+        self.last_active = time.monotonic()
+        self.in_flight = 0
+        self.closed = False
+        self._streams: List[ResponseStream] = []
+        self._cond = threading.Condition()
+
+    def generate_response(self, user_input: str, **kwargs) -> ResponseStream:
+        """
+        Same as Person.generate_response, using this session's history.
+        Once the reply ends, the new messages and the resulting mood are appended to the turn log and fsynced.
+        """
+        with self._cond:
+            if self.closed:
+                raise RuntimeError(f"Session {self.session_id!r} has been hibernated; load it from the store again")
+            # Counted before the (blocking) provider call so the session cannot be hibernated underneath it
+            self.in_flight += 1
+        self.touch()
+        handle = None
+        try:
+            start = len(self.history)
+            handle = self.person.generate_response(user_input, self.history, **kwargs)
+            with self._cond:
+                self._streams.append(handle)
+            handle.add_done_callback(lambda h: self._log_turn(start, h))
+        except BaseException:
+            if handle is None:
+                self._end_turn(None)
+            raise
+        return handle
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def cancel(self):
+        """Cancels every reply still streaming in this session. Their partial turns are logged as usual."""
+        with self._cond:
+            streams = list(self._streams)
+        for handle in streams:
+            handle.cancel(reason="shutdown")
+
+    def quiesce(self, timeout: Optional[float] = 0) -> bool:
+        """
+        Waits up to `timeout` seconds (None: forever) for in-flight replies to finish, then closes the session
+        to new replies.
+
+        :return: True if the session is now idle and closed, False if a reply is still streaming.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight == 0, timeout=timeout):
+                return False
+            self.closed = True
+            return True
+
+    def write_snapshot(self, path: str, timeout: Optional[float] = 0) -> bool:
+        """
+        Folds the turn log into a snapshot at `path` and empties the log.
+        Waits up to `timeout` seconds (None: forever) for in-flight replies first, and holds off new ones until
+        done, so no turn can land between the snapshot write and the log reset.
+
+        :return: True if the snapshot was written, False if a reply was still streaming.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight == 0, timeout=timeout):
+                return False
+            self.log.sync()
+            write_snapshot(path, self.to_snapshot())
+            self.log.reset()
+            return True
+
+    def _log_turn(self, start: int, handle: ResponseStream):
+        try:
+            for message in self.history[start:]:
+                self._append({"type": "message", "message": message})
+            self._append({"type": "mood", "mood": asdict(self.person.mood)})
+            # One fsync per turn: the turn's records are batched, and none linger unsynced once it ends
+            self.log.sync()
+            self._trim()
+            self.touch()
+        finally:
+            self._end_turn(handle)
+
+    def _end_turn(self, handle: Optional[ResponseStream]):
+        with self._cond:
+            self.in_flight -= 1
+            if handle in self._streams:
+                self._streams.remove(handle)
+            self._cond.notify_all()
+
+    def _append(self, record: Dict[str, Any]):
+        self.seq += 1
+        record["seq"] = self.seq
+        self.log.append(record)
+
+    def _trim(self):
+        # Sliding window, same policy as main.py used to apply by hand
+        if self.max_history and len(self.history) > self.max_history:
+            del self.history[:-self.max_history]
+
+    def apply(self, record: Dict[str, Any]):
+        """Replays one turn log record onto the in-memory state."""
+        kind = record.get("type")
+        if kind == "message":
+            self.history.append(record["message"])
+            self._trim()
+        elif kind == "mood":
+            self.person.mood = EmotionalState(**record["mood"])
+        self.seq = max(self.seq, record.get("seq", self.seq))
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "seq": self.seq,
+            "person": self.person.to_state(),
+            "history": list(self.history),
+        }
+
+
+class SessionStore:
+    def __init__(self, root: str = "sessions", fsync_every: int = 8, fsync_interval: float = 1.0, max_history: int = 10):
+        """
+        Persists sessions as `<root>/<session_id>.snap` (binary snapshot) plus `<root>/<session_id>.log` (turn log).
+
+        Loading a session reads the snapshot and replays the log on top of it, so no LLM calls are needed to
+        rebuild a persona. Idle sessions can be hibernated to disk to bound memory use.
+
+        :param root: Directory holding session files. Created if missing.
+        :param fsync_every: See TurnLog.
+        :param fsync_interval: See TurnLog.
+        :param max_history: Sliding window size for each session's chat history.
+        """
+        self.root = root
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_history = max_history
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, session_id: str) -> Tuple[str, str]:
+        if not session_id or session_id in {".", ".."} or "/" in session_id or os.sep in session_id:
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        base = os.path.join(self.root, session_id)
+        return f"{base}.snap", f"{base}.log"
+
+    def _open_log(self, path: str) -> TurnLog:
+        return TurnLog(path, fsync_every=self.fsync_every, fsync_interval=self.fsync_interval)
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions or os.path.exists(self._paths(session_id)[0])
+
+    def is_live(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def create(self, session_id: str, person: Person, history: Optional[List[Dict[str, Any]]] = None, timeout: float = 5.0) -> Session:
+        """
+        Registers a new session and writes its initial snapshot. Overwrites any existing session with this id.
+        A live session being replaced has its streaming replies cancelled, and is waited on for up to `timeout`
+        seconds to finish logging them.
+        """
+        snap_path, log_path = self._paths(session_id)
+        with self._lock:
+            old = self._sessions.get(session_id)
+            if old:
+                old.cancel()
+                if not old.quiesce(timeout):
+                    raise RuntimeError(f"Session {session_id!r} is still streaming; cannot overwrite it")
+                del self._sessions[session_id]
+                old.log.close()
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            session = Session(session_id, person, list(history or []), self._open_log(log_path), max_history=self.max_history)
+            write_snapshot(snap_path, session.to_snapshot())
+            self._sessions[session_id] = session
+            return session
+
+    def load(self, session_id: str) -> Session:
+        """Returns the live session, restoring it from disk if it is hibernated."""
+        snap_path, log_path = self._paths(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session.touch()
+                return session
+
+            state = read_snapshot(snap_path)
+            records, _ = TurnLog.scan(log_path)
+            session = Session(
+                session_id,
+                Person.from_state(state["person"]),
+                state.get("history", []),
+                self._open_log(log_path),
+                seq=state.get("seq", 0),
+                max_history=self.max_history,
+            )
+            snapshot_seq = session.seq
+            for record in records:
+                # Records already folded into the snapshot (crash between snapshot and log reset) are skipped
+                if record.get("seq", 0) > snapshot_seq:
+                    session.apply(record)
+            self._sessions[session_id] = session
+            return session
+
+    def snapshot(self, session_id: str, timeout: Optional[float] = 0) -> bool:
+        """
+        Folds the turn log into a fresh snapshot and empties the log. See Session.write_snapshot.
+
+        :return: True if the snapshot was written (or the session is not live), False if it was busy.
+        """
+        snap_path, _ = self._paths(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return True
+            return session.write_snapshot(snap_path, timeout=timeout)
+
+    def hibernate(self, session_id: str, timeout: Optional[float] = 0) -> bool:
+        """
+        Snapshots a session and drops it from memory. The next load() restores it.
+        A session with a reply still streaming is waited on for up to `timeout` seconds (None: forever);
+        if it is still busy after that, it is left live.
+
+        :return: True if the session is no longer live, False if it was busy and left alone.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return True
+            if not session.quiesce(timeout):
+                return False
+            self.snapshot(session_id)
+            self._sessions.pop(session_id)
+            session.log.close()
+            return True
+
+    def hibernate_idle(self, max_idle: float) -> List[str]:
+        """
+        Hibernates every session that has been inactive for more than `max_idle` seconds.
+        Sessions with a reply still streaming are left alone.
+
+        :return: The ids of the hibernated sessions.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [sid for sid, s in self._sessions.items() if not s.in_flight and now - s.last_active > max_idle]
+            return [session_id for session_id in idle if self.hibernate(session_id)]
+
+    def close(self, timeout: float = 5.0) -> List[str]:
+        """
+        Hibernates all live sessions. Call on shutdown.
+        Replies still streaming are cancelled first, and their partial turns are logged.
+
+        :param timeout: Seconds to wait for each cancelled reply to finish logging.
+        :return: The ids of sessions that were still busy and therefore not hibernated (their turn log stays open).
+        """
+        busy = []
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                session.cancel()
+                if not self.hibernate(session_id, timeout=timeout):
+                    print(f"[Session] {session_id} is still streaming, not hibernated")
+                    busy.append(session_id)
+        return busy
@@ -3,15 +3,19 @@ import json
 import re
 import sys
 import os
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from typing import Dict, List, Optional, Any, Generator
 
 # 将项目根目录加入 sys.path，解决找不到模块的问题
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ai.client import AIClient
+from ai.stream import ResponseStream
 from config import Config
 
+# 回复被中断 (用户 Ctrl-C / 客户端断开 / 超时) 时追加到历史记录里的标记
+INTERRUPTED_MARKER = "[interrupted]"
+
 @dataclass
 class BigFiveProfile:
     """
@@ -122,6 +126,30 @@ STEP 3: TONE & STYLE VERIFICATION
 - **Anti-Robot Filter:** Scan the draft for words like "help you with tasks", "digital steward", "capabilities". REPLACE them with human expressions like "give you a hand", "partner", "strengths".
 """
 
+    def to_state(self) -> Dict[str, Any]:
+        """导出可持久化的人设状态 (不含 AI client 和对话历史)"""
+        return {
+            "name": self.name,
+            "gender": self.gender,
+            "if_original": self.if_original,
+            "personality": asdict(self.personality),
+            "mood": asdict(self.mood),
+            "style_examples": self.style_examples,
+            "source_work": list(self.source_work),
+            "keywords": list(self.keywords),
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Person":
+        """从 to_state() 导出的数据恢复角色，不需要任何 LLM 调用"""
+        person = cls(name=state["name"], gender=state["gender"], if_original=state.get("if_original", False))
+        person.personality = BigFiveProfile(**state.get("personality", {}))
+        person.mood = EmotionalState(**state.get("mood", {}))
+        person.style_examples = state.get("style_examples", person.style_examples)
+        person.source_work = state.get("source_work", [])
+        person.keywords = state.get("keywords", [])
+        return person
+
     def _collect_response(self, stream_response):
         """Helper to collect full text from a stream or string."""
         text = ""
@@ -465,10 +493,18 @@ Output your internal thought process in <thinking>...</thinking> tags, then prin
 """
         return instruction
     
-    def generate_response(self, user_input: str, chat_history: List[Dict]):
+    def generate_response(self, user_input: str, chat_history: List[Dict], max_latency: Optional[float] = None, max_tokens: Optional[int] = None, extra_instruction: Optional[str] = None, record: bool = True) -> ResponseStream:
         """
         【适配新 AIClient 版】生成回复
         利用 liteLLM 标准格式 (OpenAI format)
+
+        返回一个可迭代的 ResponseStream 句柄，可随时 cancel()。
+        流结束时 (正常结束、被取消或超时) 会自动把本轮的用户输入和 (可能不完整的) 回复写入 chat_history。
+
+        :param max_latency: 可选，最长生成时间 (秒)，超时后立即停止并关闭连接。
+        :param max_tokens: 可选，输出 token 上限，由模型服务端执行 (包含 <thinking> 部分)，截断的回复同样标记为中断。
+        :param extra_instruction: 可选，追加到系统指令末尾的额外设定 (例如多人场景的说明)。
+        :param record: 是否在流结束时写入 chat_history。由调用方自己管理历史时 (例如 Scene) 设为 False。
         """
         # 1. 获取核心设定 (人设)
         system_prompt = self.set_basic_assistance_prompt()
@@ -478,6 +514,8 @@ Output your internal thought process in <thinking>...</thinking> tags, then prin
         
         # 组合成完整的系统指令
         full_system_instruction = f"{system_prompt}\n\n{reinforcement}"
+        if extra_instruction:
+            full_system_instruction = f"{full_system_instruction}\n\n{extra_instruction}"
 
         # 步骤 A: 处理历史记录
         # 将历史记录转换为 OpenAI 格式 (role: user/assistant)
@@ -503,12 +541,23 @@ Output your internal thought process in <thinking>...</thinking> tags, then prin
         # 步骤 B: 添加当前用户消息
         lite_llm_messages.append({"role": "user", "content": user_input})
         
-        # 4. 调用 API (返回流式生成器)
-        # 注意: 这里的 stream=True 会返回一个 generator
-        response_stream = self.ai_client.generate_response(
+        # 4. 调用 API (返回可取消的流式句柄)，结束时把本轮对话写回历史
+        return self.ai_client.stream_response(
             messages=lite_llm_messages, 
             system_instruction=full_system_instruction,
-            stream=True
+            max_latency=max_latency,
+            max_tokens=max_tokens,
+            on_close=(lambda handle: self._record_turn(chat_history, user_input, handle)) if record else None,
         )
-        
-        return response_stream
\ No newline at end of file
+
+    def _record_turn(self, chat_history: List[Dict], user_input: str, handle: ResponseStream):
+        """
+        历史记录存储策略：只存“纯粹”的对话内容，不存 system prompt。
+        被中断的回复保留已生成的部分，并加上 INTERRUPTED_MARKER，让模型下一轮知道自己被打断了。
+        """
+        chat_history.append({"role": "user", "content": user_input})
+        if handle.interrupted:
+            content = f"{handle.text}{INTERRUPTED_MARKER}"
+            chat_history.append({"role": "assistant", "content": content, "interrupted": True})
+        else:
+            chat_history.append({"role": "assistant", "content": handle.text})
@@ -0,0 +1,295 @@
+import random
+import re
+import sys
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 将项目根目录加入 sys.path，解决找不到模块的问题
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.stream import ResponseStream
+from personal.person import Person, INTERRUPTED_MARKER
+
+USER_SPEAKER = "User"
+
+# 每轮默认并发生成的候选数：兜底一个沉默/失败的角色即可，不必为每个角色都付一次流的钱
+DEFAULT_FANOUT = 2
+
+
+@dataclass
+class TranscriptEntry:
+    """
+    场景中的一句台词。
+    两种视角下的消息 (说话者本人 / 其他听众) 只构建一次，所有角色共享同一份对象，不按角色复制。
+    """
+    speaker: str
+    content: str
+    as_self: Dict[str, str] = field(init=False)
+    as_other: Dict[str, str] = field(init=False)
+
+    def __post_init__(self):
+        self.as_self = {"role": "assistant", "content": self.content}
+        self.as_other = {"role": "user", "content": f"{self.speaker}: {self.content}"}
+
+
+class Transcript:
+    """所有角色共享的场景记录 (去重)"""
+
+    def __init__(self):
+        self.entries: List[TranscriptEntry] = []
+
+    def append(self, speaker: str, content: str) -> Optional[TranscriptEntry]:
+        """
+        追加一句台词。空台词和与同一说话者上一句完全相同的重复台词会被丢弃。
+
+        :return: 新的记录，被丢弃时返回 None。
+        """
+        content = content.strip()
+        if not content:
+            return None
+        for entry in reversed(self.entries):
+            if entry.speaker == speaker:
+                if entry.content == content:
+                    return None
+                break
+        entry = TranscriptEntry(speaker, content)
+        self.entries.append(entry)
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class _CharacterView:
+    """
+    单个角色眼中的场景：增量地从共享 Transcript 构建 prompt 消息。
+    每次只处理上次之后新增的台词，而不是每轮重新复制整个记录。
+    """
+
+    MENTION_RAISE = 0.5
+    SPOKE_DROP = 0.4
+    AROUSAL_RETAIN = 0.8
+
+    def __init__(self, person: Person, window: int):
+        self.person = person
+        self.window = window
+        self.messages: List[Dict[str, str]] = []
+        self.cursor = 0
+        self.turns_since_spoke = 0
+        # 场景内的激活度：以角色自身情绪为基线，被点名时升高，自己刚说完话时回落。不回写 Person.mood
+        self.baseline_arousal = person.mood.arousal
+        self.arousal = self.baseline_arousal
+
+    @property
+    def name(self) -> str:
+        return self.person.name
+
+    def sync(self, transcript: Transcript):
+        for entry in transcript.entries[self.cursor:]:
+            if entry.speaker == self.name:
+                self.messages.append(entry.as_self)
+                self.turns_since_spoke = 0
+                self.arousal -= self.SPOKE_DROP
+            else:
+                self.messages.append(entry.as_other)
+                self.turns_since_spoke += 1
+                # 每听一句就向基线回归一些
+                self.arousal = self.baseline_arousal + (self.arousal - self.baseline_arousal) * self.AROUSAL_RETAIN
+                if self.name in entry.content:
+                    self.arousal += self.MENTION_RAISE
+            self.arousal = max(-1.0, min(1.0, self.arousal))
+        self.cursor = len(transcript.entries)
+        if self.window and len(self.messages) > self.window:
+            del self.messages[:-self.window]
+
+
+class _Race:
+    """一轮并发生成的裁决：选出胜者后，取消其余所有候选 (包括还没来得及创建流的)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handles: List[ResponseStream] = []
+        self.winner: Optional[ResponseStream] = None
+        self.decided = False
+
+    def register(self, handle: ResponseStream) -> bool:
+        with self._lock:
+            if not self.decided:
+                self._handles.append(handle)
+                return True
+        handle.cancel(reason="lost")
+        return False
+
+    def decide(self, winner: Optional[ResponseStream]):
+        with self._lock:
+            self.decided = True
+            self.winner = winner
+            losers = [h for h in self._handles if h is not winner]
+        for handle in losers:
+            handle.cancel(reason="lost")
+
+
+class Scene:
+    def __init__(self, characters: List[Person], setting: str = "", fanout: int = DEFAULT_FANOUT, window: int = 20, seed: Optional[int] = None, **generation_kwargs):
+        """
+        多角色群聊场景：多个 Person 共享一份对话记录。
+
+        轮到谁说话由调度器决定 (外向性 + 场景内激活度 + 是否被点名 + 多久没说话)。
+        排名靠前的 fanout 个角色并发生成候选回复，按排名顺序选出第一个真正开口的角色，其余候选立即取消，
+        因此多人场景的延迟接近单个角色。
+
+        :param characters: 参与场景的角色，名字需唯一。
+        :param setting: 场景描述，会注入每个角色的系统指令。
+        :param fanout: 每轮并发生成的候选数 (默认 DEFAULT_FANOUT)，设为 0 表示所有可发言的角色。
+        :param window: 每个角色 prompt 中保留的最近台词数。
+        :param seed: 调度器随机数种子 (可选，便于复现)。
+        :param generation_kwargs: 透传给 Person.generate_response (例如 max_latency, max_tokens)。
+        """
+        names = [p.name for p in characters]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Character names must be unique: {names}")
+        if USER_SPEAKER in names:
+            raise ValueError(f"'{USER_SPEAKER}' is reserved for the user")
+
+        self.setting = setting
+        self.fanout = fanout
+        self.generation_kwargs = generation_kwargs
+        self.transcript = Transcript()
+        self.views: Dict[str, _CharacterView] = {p.name: _CharacterView(p, window) for p in characters}
+        self._rng = random.Random(seed)
+        # 线程池留出一倍余量：上一轮被取消的候选可能还卡在发起请求的阶段，不能让下一轮的候选排在它们后面
+        candidates = min(fanout, len(characters)) if fanout else len(characters)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, 2 * candidates), thread_name_prefix="scene")
+        self._current: Optional[ResponseStream] = None
+
+        # 调度权重
+        self.extraversion_weight = 0.6
+        self.arousal_weight = 0.4
+        self.mention_bonus = 1.0
+        self.wait_bonus = 0.1
+
+    def add_line(self, content: str, speaker: str = USER_SPEAKER) -> Optional[TranscriptEntry]:
+        """加入一句用户台词或旁白"""
+        return self.transcript.append(speaker, content)
+
+    def rank_speakers(self) -> List[Person]:
+        """
+        按调度分数做加权随机排序 (分数越高越可能排在前面)。
+        上一句的说话者不会连续发言。
+        """
+        last = self.transcript.entries[-1] if self.transcript.entries else None
+        keyed = []
+        for view in self.views.values():
+            view.sync(self.transcript)
+            if last and last.speaker == view.name:
+                continue
+            score = max(self._score(view, last), 1e-6)
+            # Efraimidis-Spirakis 加权无放回抽样
+            keyed.append((self._rng.random() ** (1 / score), view.person))
+        keyed.sort(key=lambda item: item[0], reverse=True)
+        return [person for _, person in keyed]
+
+    def _score(self, view: _CharacterView, last: Optional[TranscriptEntry]) -> float:
+        score = self.extraversion_weight * view.person.personality.extraversion
+        score += self.arousal_weight * (view.arousal + 1) / 2
+        if last and view.name in last.content:
+            score += self.mention_bonus
+        score += self.wait_bonus * min(view.turns_since_spoke, 5)
+        return score
+
+    def step(self) -> Tuple[Optional[Person], Optional[ResponseStream]]:
+        """
+        进行一轮发言。阻塞到胜出角色的第一个 token 到达，然后返回 (角色, 流)。
+        调用方迭代这个流来输出回复；流结束 (包括被 cancel) 时台词会自动写入 transcript。
+        所有候选都失败或沉默时返回 (None, None)。
+        """
+        if self._current is not None and not self._current.finished:
+            raise RuntimeError("The previous turn is still streaming; consume or cancel it first.")
+
+        ranked = self.rank_speakers()
+        if self.fanout:
+            ranked = ranked[:self.fanout]
+
+        race = _Race()
+        futures = [(person, self._executor.submit(self._run_candidate, person, race)) for person in ranked]
+
+        winner: Optional[Tuple[Person, ResponseStream]] = None
+        for person, future in futures:
+            try:
+                handle = future.result()
+            except Exception as e:
+                print(f"[Scene Error] {person.name}: {e}")
+                continue
+            if handle is not None and handle.text:
+                winner = (person, handle)
+                break
+
+        race.decide(winner[1] if winner else None)
+        for _, future in futures:
+            future.cancel()
+
+        if winner is None:
+            return None, None
+
+        person, handle = winner
+        self._current = handle
+        handle.add_done_callback(lambda h: self._record_line(person, h))
+        return person, handle
+
+    def close(self):
+        if self._current is not None:
+            self._current.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run_candidate(self, person: Person, race: _Race) -> Optional[ResponseStream]:
+        if race.decided:
+            return None
+        # rank_speakers() 已在主线程同步过视图，这里只读
+        view = self.views[person.name]
+
+        # 最后一条 (别人说的) 台词作为本轮输入，其余作为历史
+        if view.messages:
+            history, user_input = view.messages[:-1], view.messages[-1]["content"]
+        else:
+            history, user_input = [], "(The scene begins.)"
+
+        handle = person.generate_response(
+            user_input,
+            history,
+            extra_instruction=self._scene_instruction(person),
+            record=False,
+            **self.generation_kwargs
+        )
+        if not race.register(handle):
+            return None
+        handle.prefetch()
+        return handle
+
+    def _scene_instruction(self, person: Person) -> str:
+        others = [name for name in self.views if name != person.name]
+        return f"""
+[SCENE: GROUP CONVERSATION]
+{self.setting}
+Other people present: {", ".join(others)}. The user may also speak as "{USER_SPEAKER}".
+Lines spoken by others are shown as "Name: line".
+Reply ONLY with your own next line as {person.name}. Do not write lines for anyone else and do not prefix your line with your name.
+"""
+
+    def _record_line(self, person: Person, handle: ResponseStream):
+        # 只把最终台词放进共享记录，<thinking> 内容不让其他角色“听到”
+        content = re.sub(r"<thinking>.*?(</thinking>|$)", "", handle.text, flags=re.DOTALL).strip()
+        if not content:
+            # 在 <thinking> 阶段就被打断，什么也没说出口：不要把孤零零的中断标记放进共享记录
+            return
+        if handle.interrupted:
+            content = f"{content}{INTERRUPTED_MARKER}"
+        self.transcript.append(person.name, content)
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# 将项目根目录加入 sys.path，和 personal/person.py 的做法一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.stream import ResponseStream
+
+
+def make_chunk(content=None, finish_reason=None):
+    """Builds an object shaped like a LiteLLM streaming chunk."""
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+
+class FakeStream:
+    """
+    Provider stream double: yields `tokens`, optionally stalling before the chunk at `stall_at`
+    until close() is called or `stall` seconds pass.
+    """
+
+    def __init__(self, tokens, stall_at=None, stall=0.0, finish_reason="stop", error=None):
+        self.tokens = list(tokens)
+        self.stall_at = stall_at
+        self.stall = stall
+        self.finish_reason = finish_reason
+        self.error = error
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        for i, token in enumerate(self.tokens):
+            if i == self.stall_at:
+                self.closed.wait(self.stall)
+            if self.closed.is_set():
+                raise ConnectionError("stream closed")
+            last = i == len(self.tokens) - 1
+            yield make_chunk(token, self.finish_reason if last else None)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeAIClient:
+    """Stands in for AIClient: every streaming call pops the next FakeStream from `streams`."""
+
+    def __init__(self, *args, **kwargs):
+        self.streams = []
+        self.calls = []
+
+    def stream_response(self, messages, system_instruction=None, max_latency=None, max_tokens=None, on_close=None, **kwargs):
+        self.calls.append({"messages": messages, "system_instruction": system_instruction, "max_tokens": max_tokens})
+        stream = self.streams.pop(0) if self.streams else FakeStream(["ok"])
+        return ResponseStream(stream, max_latency=max_latency, on_close=on_close, on_release=lambda reusable: stream.close())
+
+
+@pytest.fixture
+def make_person(monkeypatch):
+    """Returns a factory for Person objects wired to FakeAIClient (no config.yaml or network needed)."""
+    import personal.person as person_module
+
+    monkeypatch.setattr(person_module, "AIClient", FakeAIClient)
+
+    def factory(name="甲", streams=(), **kwargs):
+        person = person_module.Person(name=name, gender="Female", **kwargs)
+        person.ai_client.streams.extend(streams)
+        return person
+
+    return factory
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
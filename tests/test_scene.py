@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from personal.person import INTERRUPTED_MARKER
+from personal.scene import Scene, Transcript
+from conftest import FakeStream, wait_until
+
+
+def test_transcript_shares_entries_and_drops_repeats():
+    transcript = Transcript()
+    first = transcript.append("甲", "你好")
+
+    assert transcript.append("甲", "你好 ") is None
+    assert transcript.append("乙", "") is None
+    assert transcript.append("乙", "你好") is not None
+    assert first.as_other["content"] == "甲: 你好"
+    assert len(transcript) == 2
+
+
+def test_step_cancels_stalled_losers_promptly(make_person):
+    winner = make_person("甲", streams=[FakeStream(["<thinking>嗯</thinking>", "大家好"]), FakeStream(["又是我"])])
+    loser_streams = [FakeStream(["我"], stall_at=0, stall=3.0) for _ in range(2)]
+    losers = [make_person(name, streams=[stream]) for name, stream in zip(("乙", "丙"), loser_streams)]
+    scene = Scene([winner, *losers], fanout=3)
+    scene.rank_speakers = lambda: [winner, *losers]
+    scene.add_line("早上好")
+
+    started = time.monotonic()
+    person, handle = scene.step()
+    assert person is winner
+    assert handle.collect() == "<thinking>嗯</thinking>大家好"
+    assert time.monotonic() - started < 1.0
+
+    assert wait_until(lambda: all(stream.closed.is_set() for stream in loser_streams), timeout=0.5)
+    assert [e.content for e in scene.transcript.entries] == ["早上好", "大家好"]
+
+    # The next step must not queue behind the previous step's losers
+    scene.rank_speakers = lambda: [winner]
+    started = time.monotonic()
+    person, handle = scene.step()
+    handle.collect()
+    assert time.monotonic() - started < 1.0
+    scene.close()
+
+
+def test_reply_cancelled_during_thinking_is_not_recorded(make_person):
+    speaker = make_person("甲", streams=[FakeStream(["<thinking>让我想想", "……"], stall_at=1, stall=3.0)])
+    scene = Scene([speaker, make_person("乙")], fanout=1)
+    scene.rank_speakers = lambda: [speaker]
+    scene.add_line("在吗")
+
+    _, handle = scene.step()
+    handle.cancel()
+
+    assert [e.content for e in scene.transcript.entries] == ["在吗"]
+    scene.close()
+
+
+def test_partial_reply_is_recorded_with_marker(make_person):
+    speaker = make_person("甲", streams=[FakeStream(["在的", "……"], stall_at=1, stall=3.0)])
+    scene = Scene([speaker, make_person("乙")], fanout=1)
+    scene.rank_speakers = lambda: [speaker]
+    scene.add_line("在吗")
+
+    _, handle = scene.step()
+    handle.cancel()
+
+    assert scene.transcript.entries[-1].content == f"在的{INTERRUPTED_MARKER}"
+    scene.close()
+
+
+def test_views_are_built_incrementally_from_shared_entries(make_person):
+    a, b = make_person("甲"), make_person("乙")
+    scene = Scene([a, b], seed=0)
+    scene.add_line("大家好")
+    scene.rank_speakers()
+    scene.add_line("还有人吗")
+    scene.rank_speakers()
+
+    entries = scene.transcript.entries
+    for view in scene.views.values():
+        assert view.cursor == 2
+        assert view.messages[0] is entries[0].as_other
+        assert view.messages[1] is entries[1].as_other
+    scene.close()
+
+
+def test_last_speaker_does_not_talk_twice(make_person):
+    a, b = make_person("甲"), make_person("乙")
+    scene = Scene([a, b], seed=0)
+    scene.add_line("我先说", speaker="甲")
+
+    assert scene.rank_speakers() == [b]
+    scene.close()
+
+
+def test_duplicate_names_rejected(make_person):
+    with pytest.raises(ValueError):
+        Scene([make_person("甲"), make_person("甲")])
+
+
+def test_being_addressed_raises_arousal_and_ranking(make_person):
+    a, b, c = make_person("甲"), make_person("乙"), make_person("丙")
+    scene = Scene([a, b, c], seed=0)
+    scene.add_line("乙，你怎么看？")
+    scene.add_line("今天天气不错", speaker="甲")
+    scene.rank_speakers()
+
+    views = scene.views
+    last = scene.transcript.entries[-1]
+    assert views["乙"].arousal > views["丙"].arousal
+    assert views["甲"].arousal < views["丙"].arousal
+    assert scene._score(views["乙"], last) > scene._score(views["丙"], last)
+    # 场景内的激活度不回写角色本身的情绪
+    assert a.mood.arousal == b.mood.arousal == c.mood.arousal == 0
+
+    firsts = [scene.rank_speakers()[0] for _ in range(500)]
+    assert firsts.count(b) > firsts.count(c)
+    scene.close()
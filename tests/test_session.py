@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+
+import pytest
+
+from config import Config
+from core.session import SessionStore, TurnLog, read_snapshot, write_snapshot
+from personal.person import INTERRUPTED_MARKER
+from conftest import FakeStream, wait_until
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(root=str(tmp_path / "sessions"), max_history=4)
+
+
+def reopen(store):
+    """A fresh store over the same directory, as after a process restart."""
+    return SessionStore(root=store.root, max_history=store.max_history)
+
+
+def test_round_trip_restores_persona_and_history(store, make_person):
+    person = make_person(streams=[FakeStream(["你好"]), FakeStream(["再见"])], if_original=True)
+    person.personality.extraversion = 0.9
+    person.keywords = ["咖啡"]
+    person.style_examples = "[开心] 好呀"
+    session = store.create("甲", person)
+    session.generate_response("hi").collect()
+    person.mood.update(0.3, 0.2, 0.1)
+    session.generate_response("bye").collect()
+    store.close()
+
+    restored = reopen(store).load("甲")
+
+    assert restored.history == session.history
+    assert restored.person.to_state() == person.to_state()
+    assert restored.seq == session.seq
+
+
+def test_turns_survive_crash_without_hibernate(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"])]))
+    session.generate_response("hi").collect()
+
+    restored = reopen(store).load("甲")
+
+    assert restored.history == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "你好"}]
+
+
+def test_crash_between_snapshot_and_log_reset_does_not_duplicate(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"])]))
+    session.generate_response("hi").collect()
+    # Snapshot written, but the process dies before the log is emptied
+    snap_path = os.path.join(store.root, "甲.snap")
+    write_snapshot(snap_path, session.to_snapshot())
+
+    restored = reopen(store).load("甲")
+
+    assert restored.history == session.history
+
+
+def test_torn_tail_is_dropped_and_log_stays_appendable(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"]), FakeStream(["在"])]))
+    session.generate_response("hi").collect()
+    log_path = os.path.join(store.root, "甲.log")
+    records, valid_size = TurnLog.scan(log_path)
+    with open(log_path, "ab") as f:
+        f.write(b"\x00\x00\x01\x00garbage")
+
+    restored = reopen(store).load("甲")
+    assert os.path.getsize(log_path) == valid_size
+    restored.person.ai_client.streams.append(FakeStream(["在"]))
+    restored.generate_response("还在吗").collect()
+
+    assert len(TurnLog.scan(log_path)[0]) == len(records) + 3
+    assert reopen(store).load("甲").history[-1] == {"role": "assistant", "content": "在"}
+
+
+def test_corrupted_snapshot_is_rejected(store, make_person):
+    store.create("甲", make_person())
+    snap_path = os.path.join(store.root, "甲.snap")
+    with open(snap_path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\xff")
+
+    with pytest.raises(ValueError):
+        read_snapshot(snap_path)
+
+
+def test_cancelled_reply_is_logged_with_marker(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好", "呀"], stall_at=1, stall=3.0)]))
+
+    session.generate_response("hi", max_latency=0.2).collect()
+
+    restored = reopen(store).load("甲")
+    assert restored.history[-1]["content"] == f"你好{INTERRUPTED_MARKER}"
+    assert session.in_flight == 0
+
+
+def test_turn_is_fsynced_when_it_ends(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"])]))
+
+    session.generate_response("hi").collect()
+
+    assert session.log._pending == 0
+
+
+def test_hibernate_refuses_busy_session(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好", "呀"], stall_at=1, stall=0.3)]))
+    handle = session.generate_response("hi")
+    assert handle.prefetch()
+
+    assert store.hibernate("甲") is False
+    assert store.hibernate_idle(max_idle=-1) == []
+    assert store.is_live("甲")
+
+    handle.collect()
+    assert store.hibernate("甲") is True
+    assert reopen(store).load("甲").history[-1]["content"] == "你好呀"
+
+
+def test_close_cancels_streaming_reply_and_logs_it(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好", "呀"], stall_at=1, stall=3.0)]))
+    handle = session.generate_response("hi")
+    assert handle.prefetch()
+    consumer = threading.Thread(target=handle.collect)
+    consumer.start()
+    assert wait_until(lambda: handle._consuming)
+
+    assert store.close() == []
+    consumer.join(1.0)
+
+    assert not consumer.is_alive()
+    assert reopen(store).load("甲").history[-1]["content"] == f"你好{INTERRUPTED_MARKER}"
+
+
+def test_hibernated_session_rejects_new_replies(store, make_person):
+    session = store.create("甲", make_person())
+    store.hibernate("甲")
+
+    with pytest.raises(RuntimeError):
+        session.generate_response("hi")
+
+
+def test_in_flight_counted_during_provider_call(store, make_person):
+    person = make_person()
+    session = store.create("甲", person)
+    entered, release = threading.Event(), threading.Event()
+    stream_response = person.ai_client.stream_response
+
+    def slow_stream_response(*args, **kwargs):
+        entered.set()
+        release.wait(2.0)
+        return stream_response(*args, **kwargs)
+
+    person.ai_client.stream_response = slow_stream_response
+    worker = threading.Thread(target=lambda: session.generate_response("hi").collect())
+    worker.start()
+    assert entered.wait(2.0)
+
+    assert store.hibernate_idle(max_idle=-1) == []
+    release.set()
+    worker.join(2.0)
+    assert session.in_flight == 0
+
+
+def test_provider_error_releases_in_flight(store, make_person):
+    person = make_person()
+    session = store.create("甲", person)
+
+    def failing_stream_response(*args, **kwargs):
+        raise ConnectionError("provider down")
+
+    person.ai_client.stream_response = failing_stream_response
+    with pytest.raises(ConnectionError):
+        session.generate_response("hi")
+
+    assert session.in_flight == 0
+
+
+def test_idle_sessions_are_hibernated(store, make_person):
+    store.create("甲", make_person())
+    time.sleep(0.05)
+
+    assert store.hibernate_idle(max_idle=0.01) == ["甲"]
+    assert not store.is_live("甲") and store.exists("甲")
+
+
+def test_empty_session_config_section(tmp_path):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text("ai:\n  model: gemini/gemini-1.5-flash\nsession:\n")
+
+    assert Config(str(config_path)).get_session_config() == {}
+
+
+def test_snapshot_skips_busy_session(store, make_person):
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"])]))
+    handle = session.generate_response("hi")
+
+    assert store.snapshot("甲") is False
+    handle.collect()
+    assert store.snapshot("甲") is True
+    assert reopen(store).load("甲").history[-1]["content"] == "你好"
+
+
+def test_turn_during_snapshot_write_is_not_lost(store, make_person, monkeypatch):
+    import core.session as session_module
+
+    session = store.create("甲", make_person(streams=[FakeStream(["你好"])]))
+    turn = threading.Thread(target=lambda: session.generate_response("hi").collect())
+    real_write_snapshot = session_module.write_snapshot
+
+    def write_snapshot_with_concurrent_turn(path, state):
+        # Start a whole turn while the snapshot is being written, before the log is reset
+        turn.start()
+        turn.join(0.2)
+        real_write_snapshot(path, state)
+
+    monkeypatch.setattr(session_module, "write_snapshot", write_snapshot_with_concurrent_turn)
+    assert store.snapshot("甲") is True
+    turn.join(2.0)
+
+    assert session.history == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "你好"}]
+    assert reopen(store).load("甲").history == session.history
+
+
+def test_create_cancels_streaming_session_before_replacing_it(store, make_person):
+    old = store.create("甲", make_person(streams=[FakeStream(["你好", "呀"], stall_at=1, stall=3.0)]))
+    handle = old.generate_response("hi")
+    assert handle.prefetch()
+
+    store.create("甲", make_person())
+
+    assert handle.collect() == "你好"
+    assert old.closed
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from ai.stream import ResponseStream
+from personal.person import INTERRUPTED_MARKER
+from conftest import FakeStream
+
+
+def test_complete_stream_yields_all_chunks_and_runs_callback_once():
+    done = []
+    handle = ResponseStream(FakeStream(["a", "b", "c"]), on_close=done.append)
+
+    assert handle.collect() == "abc"
+    assert done == [handle]
+    assert handle.finished and not handle.interrupted
+
+
+def test_max_latency_returns_promptly_while_provider_is_stalled():
+    stream = FakeStream(["a", "b"], stall_at=1, stall=3.0)
+    handle = ResponseStream(stream, max_latency=0.2, on_release=lambda reusable: stream.close())
+
+    started = time.monotonic()
+    text = handle.collect()
+
+    assert time.monotonic() - started < 1.0
+    assert text == "a"
+    assert handle.cancel_reason == "max_latency"
+    assert stream.closed.is_set()
+
+
+def test_deadline_callbacks_run_on_consuming_thread():
+    threads = []
+    handle = ResponseStream(FakeStream(["a", "b"], stall_at=1, stall=3.0), max_latency=0.1,
+                            on_close=lambda h: threads.append(threading.current_thread()))
+
+    handle.collect()
+
+    assert threads == [threading.current_thread()]
+
+
+def test_cancel_from_another_thread_wakes_blocked_consumer():
+    stream = FakeStream(["a", "b"], stall_at=1, stall=3.0)
+    handle = ResponseStream(stream, on_release=lambda reusable: stream.close())
+    threading.Timer(0.1, handle.cancel).start()
+
+    started = time.monotonic()
+    assert handle.collect() == "a"
+    assert time.monotonic() - started < 1.0
+    assert handle.interrupted and handle.cancel_reason == "cancelled"
+
+
+def test_finished_is_set_only_after_callbacks_complete():
+    seen = []
+    handle = ResponseStream(FakeStream(["a"]), on_close=lambda h: seen.append(h.finished))
+
+    handle.collect()
+
+    assert seen == [False]
+    assert handle.finished
+
+
+def test_keyboard_interrupt_during_iteration_still_finishes():
+    done = []
+    handle = ResponseStream(FakeStream(["a", "b", "c"]), on_close=done.append)
+
+    with pytest.raises(KeyboardInterrupt):
+        for chunk in handle:
+            raise KeyboardInterrupt
+
+    assert done == [handle]
+    assert handle.interrupted
+
+
+def test_stream_error_marks_interrupted_and_propagates():
+    done = []
+    handle = ResponseStream(FakeStream(["a"], error=RuntimeError("boom")), on_close=done.append)
+
+    with pytest.raises(RuntimeError):
+        handle.collect()
+
+    assert done == [handle]
+    assert handle.interrupted and handle.text == "a"
+
+
+def test_length_finish_reason_marks_truncated():
+    handle = ResponseStream(FakeStream(["a", "b"], finish_reason="length"))
+
+    handle.collect()
+
+    assert handle.truncated and handle.interrupted
+
+
+def test_prefetch_buffers_first_chunk():
+    handle = ResponseStream(FakeStream(["a", "b"]))
+
+    assert handle.prefetch()
+    assert handle.text == "a"
+    assert handle.collect() == "ab"
+
+
+def test_person_records_full_turn(make_person):
+    person = make_person(streams=[FakeStream(["你好", "呀"])])
+    history = []
+
+    person.generate_response("hi", history).collect()
+
+    assert history == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "你好呀"}]
+
+
+def test_person_records_partial_reply_on_cancel(make_person):
+    person = make_person(streams=[FakeStream(["你好", "呀", "!"])])
+    history = []
+
+    handle = person.generate_response("hi", history)
+    for chunk in handle:
+        handle.cancel()
+
+    assert history[-1] == {"role": "assistant", "content": f"你好{INTERRUPTED_MARKER}", "interrupted": True}
+
+
+def test_person_records_partial_reply_on_deadline(make_person):
+    person = make_person(streams=[FakeStream(["你好", "呀"], stall_at=1, stall=3.0)])
+    history = []
+
+    person.generate_response("hi", history, max_latency=0.2, max_tokens=50).collect()
+
+    assert history[-1]["content"] == f"你好{INTERRUPTED_MARKER}"
+    assert person.ai_client.calls[-1]["max_tokens"] == 50